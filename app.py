@@ -2,35 +2,57 @@ import os
 import sys
 import warnings
 import time
+import logging
 import bcrypt
 from datetime import datetime
-from functools import wraps
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, flash, redirect, url_for, session, g, jsonify, send_from_directory
-from boto3.dynamodb.conditions import Key, Attr
+from flask import Flask, render_template, request, flash, redirect, url_for, session, jsonify, send_from_directory, Response
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+# Default to WARNING so per-request debug lines cost nothing in production (override with LOG_LEVEL)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper())
+logger = logging.getLogger(__name__)
 
 # --- Import Pipelines ---
 try:
     from ingestion_pipeline import process_and_store_lecture
     from retrieval_pipeline import retrieve_chunks_for_lecture
     from summarization_pipeline import run_single_shot_summary
-    from db_dynamo import get_dynamodb_resource, delete_lecture_fully
+    from db_dynamo import get_dynamodb_resource, get_table, delete_lecture_fully, next_user_id, LECTURES_SUBJECT_INDEX, BCRYPT_ROUNDS
 except ImportError as e:
     print(f"FATAL ERROR: Missing pipeline files. {e}", file=sys.stderr)
     sys.exit(1)
 
 # --- Configuration ---
 UPLOAD_FOLDER = 'temp'
-ALLOWED_EXTENSIONS = {'pdf'}
+ALLOWED_SUFFIXES = ('.pdf',)
+DB_QUERY_WORKERS = 16 # Max concurrent DynamoDB queries per request
+DB_WRITE_WORKERS = 25 # Max concurrent DynamoDB writes per request
+DB_CASCADE_WORKERS = 8 # Max concurrent lecture cascade deletes
+ITEM_COUNT_TTL = 60 # Seconds to reuse dashboard item counts
+SUBJECTS_TTL = 60 # Seconds to reuse the subjects list
+# Internal nginx location aliased to UPLOAD_FOLDER (e.g. '/protected_temp/'). When set, PDFs are
+# served by nginx via X-Accel-Redirect instead of being streamed through a Python worker.
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX')
+SUMMARY_REDIS_TTL = 86400 # Seconds to keep summaries in Redis (DynamoDB stays the durable copy)
 
 app = Flask(__name__)
 
 # Custom Template Filter for Dates
+@lru_cache(maxsize=4096)
+def _format_timestamp(ts, format):
+    # Many rows share the same timestamps, so reuse formatted strings
+    return datetime.fromtimestamp(ts).strftime(format)
+
 @app.template_filter('datetime')
 def format_datetime(value, format="%Y-%m-%d %H:%M"):
     if value is None: return ""
     try:
-        return datetime.fromtimestamp(float(value)).strftime(format)
+        ts = value if isinstance(value, float) else float(value)
+        return _format_timestamp(ts, format)
     except (ValueError, TypeError):
         return value
 
@@ -39,14 +61,54 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-key-please-change-in-prod')
 app.config['JSON_AS_ASCII'] = False
 
+# Server-side sessions in Redis (only the session id travels in the cookie).
+# Falls back to Flask's signed-cookie sessions when REDIS_URL is not set (local dev).
+REDIS_URL = os.environ.get('REDIS_URL')
+redis_client = None
+if REDIS_URL:
+    import redis
+    from flask_session import Session
+    redis_client = redis.from_url(REDIS_URL)
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis_client
+    Session(app)
+
+# Background ingestion (Celery over the same Redis). Without REDIS_URL, uploads are processed inline.
+ingest_lecture_task = None
+if REDIS_URL:
+    from tasks import ingest_lecture_task, get_job_state
+
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Redis is an optional cache: without REDIS_URL, or if Redis errors, these are no-ops
+def redis_get(key):
+    if redis_client is None: return None
+    try:
+        return redis_client.get(key)
+    except Exception as e:
+        logger.warning(f"Redis get failed: {e}")
+        return None
+
+def redis_setex(key, ttl, value):
+    if redis_client is None: return
+    try:
+        redis_client.setex(key, ttl, value)
+    except Exception as e:
+        logger.warning(f"Redis set failed: {e}")
+
 # =========================================
 # SECURITY HEADERS
 # =========================================
+CACHEABLE_ENDPOINTS = {'user_view_file', 'static'} # Read-only content; browsers may reuse it
+
 @app.after_request
 def add_header(response):
+    # Only auth-sensitive pages need no-store; PDFs and static assets can be cached per user.
+    # Full, ranged (PDF viewers) and revalidated responses only: a cached login redirect or 404 would outlive the session/upload.
+    if request.endpoint in CACHEABLE_ENDPOINTS and response.status_code in (200, 206, 304):
+        response.headers["Cache-Control"] = "private, max-age=3600"
+        return response
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
@@ -55,10 +117,73 @@ def add_header(response):
 # =========================================
 # DB HELPER
 # =========================================
-def get_db():
-    if 'dynamo' not in g:
-        g.dynamo = get_dynamodb_resource()
-    return g.dynamo
+# Tables come from db_dynamo.get_table(), which caches one handle per table for the whole process
+def get_lectures_for_subject(subject_name, **query_args):
+    # Query the subject_name GSI (only reads this subject's lectures, not the whole table)
+    query_args['IndexName'] = LECTURES_SUBJECT_INDEX
+    query_args['KeyConditionExpression'] = Key('subject_name').eq(subject_name)
+    lectures = []
+    while True:
+        response = get_table('Lectures').query(**query_args)
+        lectures.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return lectures
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def get_subjects_with_lectures(subjects):
+    # One Query per subject, fanned out concurrently (network bound, so threads overlap the round-trips)
+    if not subjects: return []
+    with ThreadPoolExecutor(max_workers=min(DB_QUERY_WORKERS, len(subjects))) as ex:
+        all_lectures = list(ex.map(lambda sub: get_lectures_for_subject(sub['name']), subjects))
+    return [
+        {'id': sub['name'], 'name': sub['name'], 'lectures': lectures} # Mapping name to ID
+        for sub, lectures in zip(subjects, all_lectures)
+    ]
+
+_SUBJECTS_CACHE = {} # 'subjects' -> (fetched_at, items)
+
+def scan_subjects():
+    # Cached in-process for SUBJECTS_TTL; add/edit/delete subject invalidate it
+    now = time.time()
+    cached = _SUBJECTS_CACHE.get('subjects')
+    if cached and now - cached[0] < SUBJECTS_TTL:
+        return list(cached[1])
+    # Only 'name' is ever used ('name' is a reserved word, hence the alias)
+    subjects = get_table('Subjects').scan(
+        ProjectionExpression='#n',
+        ExpressionAttributeNames={'#n': 'name'}
+    ).get('Items', [])
+    _SUBJECTS_CACHE['subjects'] = (now, subjects)
+    return list(subjects)
+
+def invalidate_subjects():
+    _SUBJECTS_CACHE.pop('subjects', None)
+
+def put_if_absent(table_name, item, pk):
+    # Single conditional PutItem instead of GetItem + PutItem. Returns False if the key already exists.
+    try:
+        get_table(table_name).put_item(
+            Item=item,
+            ConditionExpression='attribute_not_exists(#pk)',
+            ExpressionAttributeNames={'#pk': pk}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+_ITEM_COUNT_CACHE = {} # table_name -> (fetched_at, count)
+
+def get_item_count(table_name):
+    # DescribeTable's ItemCount (refreshed by DynamoDB ~every 6h) instead of a full-table COUNT scan
+    now = time.time()
+    cached = _ITEM_COUNT_CACHE.get(table_name)
+    if cached and now - cached[0] < ITEM_COUNT_TTL:
+        return cached[1]
+    count = get_dynamodb_resource().meta.client.describe_table(TableName=table_name)['Table']['ItemCount']
+    _ITEM_COUNT_CACHE[table_name] = (now, count)
+    return count
 
 # =========================================
 # AUTHENTICATION
@@ -84,8 +209,37 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Compared against when the username doesn't exist, so unknown and known users cost the same bcrypt work.
+# Stored hashes at another cost (e.g. bcrypt's old default of 12) are re-hashed at BCRYPT_ROUNDS on login.
+DUMMY_HASH = bcrypt.hashpw(b'dummy-password', bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
+def check_password(user, password):
+    password = (password or '').encode('utf-8')
+    if not user:
+        bcrypt.checkpw(password, DUMMY_HASH)
+        return False
+    stored_hash = user['password_hash'].encode('utf-8')
+    if not bcrypt.checkpw(password, stored_hash):
+        return False
+    # Hash format is $2b$<cost>$<salt+hash>
+    if int(stored_hash.split(b'$')[2]) != BCRYPT_ROUNDS:
+        rehash_password(user['username'], password)
+    return True
+
+def rehash_password(username, password):
+    # Best effort: a failed upgrade must not block the login itself
+    try:
+        hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+        get_table('Users').update_item(
+            Key={'username': username},
+            UpdateExpression="set password_hash=:p",
+            ExpressionAttributeValues={':p': hashed}
+        )
+    except Exception as e:
+        logger.warning(f"Password re-hash failed for {username}: {e}")
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_SUFFIXES)
 
 # =========================================
 # ROUTES
@@ -104,14 +258,13 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        db = get_db()
-        table = db.Table('Users')
+        table = get_table('Users')
         
         try:
             response = table.get_item(Key={'username': username})
             user = response.get('Item')
             
-            if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+            if check_password(user, password):
                 if user['role'] == 'admin':
                      flash('Invalid username or password.', 'error') # Admins use separate login mostly, but simplified here
                      return redirect(url_for('login'))
@@ -133,14 +286,13 @@ def login():
 def admin_login_auth():
     username = request.form.get('username')
     password = request.form.get('password')
-    db = get_db()
-    table = db.Table('Users')
+    table = get_table('Users')
     
     try:
         response = table.get_item(Key={'username': username})
         user = response.get('Item')
 
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+        if check_password(user, password):
             if user['role'] == 'admin':
                 session['user_id'] = user['username']
                 session['username'] = user['username']
@@ -169,33 +321,25 @@ def logout():
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
-    db = get_db()
     try:
-        # Scan count (inefficient but works for small app)
-        s_count = db.Table('Subjects').scan(Select='COUNT')['Count']
-        l_count = db.Table('Lectures').scan(Select='COUNT')['Count']
+        # Approximate counts from table metadata (no Scan)
+        s_count = get_item_count('Subjects')
+        l_count = get_item_count('Lectures')
     except: s_count = 0; l_count = 0
     return render_template('admin_dashboard.html', subject_count=s_count, lecture_count=l_count)
 
 @app.route('/admin/subjects')
 @admin_required
 def manage_subjects():
-    db = get_db()
     data = []
     try:
         # 1. Get All Subjects
-        subjects = db.Table('Subjects').scan().get('Items', [])
+        subjects = scan_subjects()
         subjects.sort(key=lambda x: x['name'])
         
-        # 2. Get All Lectures (Scan) - optimize later with GSI if needed
-        all_lectures = db.Table('Lectures').scan().get('Items', [])
-        
-        # 3. Join in Python
-        for sub in subjects:
-            # Filter lectures for this subject
-            lectures = [l for l in all_lectures if l.get('subject_name') == sub['name']]
-            # Dynamodb returns Decimal for numbers, but here we just have strings/metadata
-            data.append({'id': sub['name'], 'name': sub['name'], 'lectures': lectures}) # Mapping name to ID
+        # 2. Get each subject's Lectures (parallel GSI Queries)
+        # Dynamodb returns Decimal for numbers, but here we just have strings/metadata
+        data = get_subjects_with_lectures(subjects)
             
     except Exception as e: flash(f"DB Error: {e}", 'error')
     return render_template('manage_subjects.html', subjects_data=data)
@@ -206,13 +350,10 @@ def add_subject():
     name = request.form.get('name')
     if name:
         try:
-            db = get_db()
-            # Check exist
-            resp = db.Table('Subjects').get_item(Key={'name': name})
-            if 'Item' in resp:
+            if not put_if_absent('Subjects', {'name': name}, 'name'):
                 flash(f"Subject '{name}' already exists.", 'error')
             else:
-                db.Table('Subjects').put_item(Item={'name': name})
+                invalidate_subjects()
                 flash(f"Subject '{name}' added.", 'success')
         except Exception as e: flash(f"Error: {e}", 'error')
     return redirect(url_for('manage_subjects'))
@@ -223,28 +364,28 @@ def edit_subject(subject_id): # subject_id passed here is the OLD name
     new_name = request.form.get('new_name')
     if new_name and new_name != subject_id:
         try:
-            db = get_db()
             # DynamoDB doesn't support PK update. Must Copy & Delete.
-            # 1. Check if new name exists
-            if 'Item' in db.Table('Subjects').get_item(Key={'name': new_name}):
+            # 1-2. Create New (fails if the new name is already taken)
+            if not put_if_absent('Subjects', {'name': new_name}, 'name'):
                 flash("Subject name taken.", 'error')
                 return redirect(url_for('manage_subjects'))
             
-            # 2. Create New
-            db.Table('Subjects').put_item(Item={'name': new_name})
-            
             # 3. Update all Lectures linked to old subject (manual cascade update)
-            # This is slow, but necessary for NoSQL denormalization absent relation
-            lectures = db.Table('Lectures').scan(FilterExpression=Attr('subject_name').eq(subject_id)).get('Items', [])
-            for lect in lectures:
-                db.Table('Lectures').update_item(
+            # BatchWriteItem can't Update, so the per-lecture updates run concurrently instead
+            lectures = get_lectures_for_subject(subject_id, ProjectionExpression='lecture_id')
+            def move_lecture(lect):
+                get_table('Lectures').update_item(
                     Key={'lecture_id': lect['lecture_id']},
                     UpdateExpression="set subject_name=:n",
                     ExpressionAttributeValues={':n': new_name}
                 )
+            if lectures:
+                with ThreadPoolExecutor(max_workers=min(DB_WRITE_WORKERS, len(lectures))) as ex:
+                    list(ex.map(move_lecture, lectures))
             
             # 4. Delete Old Subject
-            db.Table('Subjects').delete_item(Key={'name': subject_id})
+            get_table('Subjects').delete_item(Key={'name': subject_id})
+            invalidate_subjects()
             flash("Subject updated.", 'success')
         except Exception as e: flash(f"Error: {e}", 'error')
     return redirect(url_for('manage_subjects'))
@@ -252,14 +393,15 @@ def edit_subject(subject_id): # subject_id passed here is the OLD name
 @app.route('/admin/subject/delete/<subject_id>', methods=['POST'])
 @admin_required
 def delete_subject(subject_id): # subject_id is the name
-    db = get_db()
     try:
-        # Cascade delete lectures
-        lectures = db.Table('Lectures').scan(FilterExpression=Attr('subject_name').eq(subject_id)).get('Items', [])
-        for lect in lectures:
-             delete_lecture_fully(lect['lecture_id'])
+        # Cascade delete lectures (GSI Query, cascades run concurrently)
+        lectures = get_lectures_for_subject(subject_id, ProjectionExpression='lecture_id')
+        if lectures:
+            with ThreadPoolExecutor(max_workers=min(DB_CASCADE_WORKERS, len(lectures))) as ex:
+                list(ex.map(lambda lect: delete_lecture_fully(lect['lecture_id']), lectures))
         
-        db.Table('Subjects').delete_item(Key={'name': subject_id})
+        get_table('Subjects').delete_item(Key={'name': subject_id})
+        invalidate_subjects()
         flash("Subject and its lectures deleted.", 'success')
     except Exception as e: flash(f"Error: {e}", 'error')
     return redirect(url_for('manage_subjects'))
@@ -276,8 +418,11 @@ def delete_lecture(lecture_id):
 @app.route('/admin/users')
 @admin_required
 def manage_users():
-    db = get_db()
-    users = db.Table('Users').scan().get('Items', [])
+    # Skip password hashes; only the listed columns are fetched
+    users = get_table('Users').scan(
+        ProjectionExpression='username, user_id, #r, created_at',
+        ExpressionAttributeNames={'#r': 'role'}
+    ).get('Items', [])
     users.sort(key=lambda x: x['username'])
     return render_template('manage_users.html', users=users)
 
@@ -287,32 +432,20 @@ def add_user():
     username = request.form.get('username')
     password = request.form.get('password')
     if username and password:
-        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
         try:
-            db = get_db()
-            table = db.Table('Users')
-            if 'Item' in table.get_item(Key={'username': username}):
+            # Next numeric ID (atomic counter in Meta table)
+            new_id = next_user_id()
+            created = put_if_absent('Users', {
+                'username': username, 
+                'user_id': new_id, 
+                'password_hash': hashed, 
+                'role': 'student',
+                'created_at': str(time.time())
+            }, 'username')
+            if not created:
                  flash("Username taken.", 'error')
             else:
-                 # Calculate next numeric ID
-                 all_users = table.scan().get('Items', [])
-                 max_id = 0
-                 for u in all_users:
-                     try:
-                         uid = int(u.get('user_id', 0))
-                         if uid > max_id: max_id = uid
-                     except ValueError:
-                         pass # Ignore non-numeric IDs (like uuids or 'admin')
-                 
-                 new_id = str(int(max_id) + 1)
-
-                 table.put_item(Item={
-                     'username': username, 
-                     'user_id': new_id, 
-                     'password_hash': hashed, 
-                     'role': 'student',
-                     'created_at': str(time.time())
-                 })
                  flash(f"User '{username}' added.", 'success')
         except Exception as e: flash(f"Error: {e}", 'error')
     return redirect(url_for('manage_users'))
@@ -320,8 +453,7 @@ def add_user():
 @app.route('/admin/user/edit/<user_id>', methods=['GET', 'POST'])
 @admin_required
 def edit_user(user_id):
-    db = get_db()
-    table = db.Table('Users')
+    table = get_table('Users')
     
     if request.method == 'POST':
         password = request.form.get('password')
@@ -343,7 +475,7 @@ def edit_user(user_id):
             expr_attr_values = {':r': role}
             
             if password:
-                hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
                 update_expr += ", password_hash=:p"
                 expr_attr_values[':p'] = hashed
             
@@ -377,8 +509,7 @@ def delete_user(user_id):
         return redirect(url_for('manage_users'))
         
     try:
-        db = get_db()
-        db.Table('Users').delete_item(Key={'username': user_id})
+        get_table('Users').delete_item(Key={'username': user_id})
         flash(f"User '{user_id}' deleted.", 'success')
     except Exception as e:
         flash(f"Error deleting user: {e}", 'error')
@@ -387,8 +518,7 @@ def delete_user(user_id):
 @app.route('/admin/upload', methods=['GET', 'POST'])
 @admin_required
 def upload_page():
-    db = get_db()
-    subjects = [r['name'] for r in db.Table('Subjects').scan().get('Items', [])]
+    subjects = [r['name'] for r in scan_subjects()]
     subjects.sort()
 
     if request.method == 'POST':
@@ -404,6 +534,10 @@ def upload_page():
             fname = secure_filename(file.filename)
             path = os.path.join(app.config['UPLOAD_FOLDER'], fname)
             file.save(path)
+            if ingest_lecture_task is not None:
+                job = ingest_lecture_task.delay(path, title, sub_name)
+                flash(f"Queued '{fname}' for processing (job {job.id}).", 'success')
+                return redirect(url_for('upload_page'))
             try:
                 process_and_store_lecture(path, title, sub_name)
                 flash(f"Processed '{fname}' successfully.", 'success')
@@ -416,37 +550,41 @@ def upload_page():
     
     return render_template('upload.html', subjects=subjects)
 
+@app.route('/admin/upload/status/<job_id>')
+@admin_required
+def upload_status(job_id):
+    if ingest_lecture_task is None:
+        return jsonify(error='Background processing is not enabled.'), 404
+    return jsonify(get_job_state(job_id))
+
 # =========================================
 # STUDENT ROUTES
 # =========================================
 @app.route('/app')
 @login_required
 def summarizer_dashboard():
-    db = get_db()
     data = []
     try:
-        subjects = db.Table('Subjects').scan().get('Items', [])
-        all_lectures = db.Table('Lectures').scan().get('Items', [])
-        
-        for sub in subjects:
-            lectures = [l for l in all_lectures if l.get('subject_name') == sub['name']]
-            data.append({'id': sub['name'], 'name': sub['name'], 'lectures': lectures})
-    except: data = []
+        subjects = scan_subjects()
+        data = get_subjects_with_lectures(subjects)
+    except Exception as e:
+        # e.g. the subject_name index is missing/backfilling (run `python db_dynamo.py` after upgrading)
+        logger.error(f"Could not load dashboard lectures: {e}")
+        data = []
     return render_template('summarizer_app.html', subjects_data=data)
 
 @app.route('/app/check_size/<lecture_id>')
 @login_required
 def check_lecture_size(lecture_id):
-    db = get_db()
     try:
         # Count chunks using Query (Count)
-        response = db.Table('LectureChunks').query(
+        response = get_table('LectureChunks').query(
             KeyConditionExpression=Key('lecture_id').eq(lecture_id),
             Select='COUNT'
         )
         return jsonify({'chunk_count': response['Count']})
     except Exception as e:
-        print(f"Error checking lecture size: {e}")
+        logger.error(f"Error checking lecture size: {e}")
         return jsonify({'chunk_count': 0})
 
 @app.route('/app/generate_summary_ajax/<lecture_id>', methods=['POST'])
@@ -456,15 +594,19 @@ def generate_summary_ajax(lecture_id):
         data = request.get_json(silent=True) or {}
         target_words = str(data.get('target_words', 600)) # Ensure string for Dynamo SK
         force_refresh = data.get('force_refresh', False)
+        cache_key = f"sum:{lecture_id}:{target_words}"
         
-        db = get_db()
-        
-        # 1. Check Cache
-        cached = None
+        # 1. Check Cache (Redis first, DynamoDB as the durable fallback)
         if not force_refresh:
-            resp = db.Table('Summaries').get_item(Key={'lecture_id': lecture_id, 'summary_type': target_words})
+            cached = redis_get(cache_key)
+            if cached is not None:
+                logger.debug(f"--- [REDIS HIT] {lecture_id} ---")
+                return jsonify({'success': True, 'summary': cached.decode('utf-8')})
+
+            resp = get_table('Summaries').get_item(Key={'lecture_id': lecture_id, 'summary_type': target_words})
             if 'Item' in resp:
-                print(f"--- [CACHE HIT] {lecture_id} ---")
+                logger.debug(f"--- [CACHE HIT] {lecture_id} ---")
+                redis_setex(cache_key, SUMMARY_REDIS_TTL, resp['Item']['content'])
                 return jsonify({'success': True, 'summary': resp['Item']['content']})
         
         # 2. Generate
@@ -475,21 +617,27 @@ def generate_summary_ajax(lecture_id):
         if "Error:" in final_summary: return jsonify({'success': False, 'error': final_summary}), 500
         
         # 3. Save Cache
-        db.Table('Summaries').put_item(Item={
+        get_table('Summaries').put_item(Item={
             'lecture_id': lecture_id,
             'summary_type': target_words,
             'content': final_summary,
             'created_at': str(time.time())
         })
+        redis_setex(cache_key, SUMMARY_REDIS_TTL, final_summary)
         
         return jsonify({'success': True, 'summary': final_summary})
     except Exception as e:
-        print(f"RAG Error: {e}")
+        logger.error(f"RAG Error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/app/view_file/<filename>')
 @login_required  
 def user_view_file(filename):
+    if X_ACCEL_PREFIX:
+        # Uploads are saved under secure_filename(), so this also blocks path traversal
+        resp = Response(mimetype='application/pdf')
+        resp.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX.rstrip('/') + '/' + secure_filename(filename)
+        return resp
     try:
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=False)
     except FileNotFoundError:
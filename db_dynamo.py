@@ -1,24 +1,65 @@
 import boto3
-import sys
 import os
+import logging
 import bcrypt
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 AWS_REGION = "us-east-1"  # Default region, can be changed
 DYNAMO_ENDPOINT = None    # Set to 'http://localhost:8000' if using DynamoDB Local
+USER_ID_COUNTER = 'user_id_counter' # Meta item holding the last assigned user_id
+# Shared connection pool: keep-alive sockets reused across request threads (skips repeat TLS handshakes)
+BOTO_CONFIG = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 3}
+)
+BCRYPT_ROUNDS = 10        # bcrypt cost factor (2^rounds iterations) for new password hashes
+
+# GSI on Lectures.subject_name (lets us Query a subject's lectures instead of Scanning)
+LECTURES_SUBJECT_INDEX = 'subject_name-index'
+LECTURES_SUBJECT_GSI = {
+    'IndexName': LECTURES_SUBJECT_INDEX,
+    'KeySchema': [{'AttributeName': 'subject_name', 'KeyType': 'HASH'}],
+    'Projection': {'ProjectionType': 'ALL'}
+}
+
+# Process-wide boto3 handles (built once, then reused by every request)
+_RESOURCE = None
+_TABLES = {}
 
 def get_dynamodb_resource():
     """
-    Returns a boto3 DynamoDB resource.
-    Uses environment variables AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY automatically.
+    Returns the shared boto3 DynamoDB resource, creating it on first use.
+    """
+    global _RESOURCE
+    if _RESOURCE is None:
+        # Runs once per process. Check if keys exist (don't log values)
+        if not os.environ.get('AWS_ACCESS_KEY_ID'):
+            logger.warning("AWS_ACCESS_KEY_ID is MISSING from environment!")
+        else:
+            logger.info(f"AWS_ACCESS_KEY_ID found: {os.environ.get('AWS_ACCESS_KEY_ID')[:4]}***")
+        _RESOURCE = _create_dynamodb_resource()
+    return _RESOURCE
+
+def get_table(table_name):
+    """
+    Returns a cached Table handle for table_name (avoids rebuilding it on every call).
     """
-    # DEBUG: Check if keys exist (don't print values)
-    if not os.environ.get('AWS_ACCESS_KEY_ID'):
-        print("DEBUG: AWS_ACCESS_KEY_ID is MISSING from environment!", file=sys.stderr)
-    else:
-        print(f"DEBUG: AWS_ACCESS_KEY_ID found: {os.environ.get('AWS_ACCESS_KEY_ID')[:4]}***", file=sys.stderr)
+    table = _TABLES.get(table_name)
+    if table is None:
+        table = get_dynamodb_resource().Table(table_name)
+        _TABLES[table_name] = table
+    return table
 
+def _create_dynamodb_resource():
+    """
+    Builds a boto3 DynamoDB resource.
+    Uses environment variables AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY automatically.
+    """
     try:
         # Explicitly pass credentials if available (fixes some platform issues)
         aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
@@ -30,12 +71,13 @@ def get_dynamodb_resource():
                 region_name=AWS_REGION, 
                 aws_access_key_id=aws_access_key_id,
                 aws_secret_access_key=aws_secret_access_key,
-                endpoint_url=DYNAMO_ENDPOINT
+                endpoint_url=DYNAMO_ENDPOINT,
+                config=BOTO_CONFIG
             )
         else:
-            return boto3.resource('dynamodb', region_name=AWS_REGION, endpoint_url=DYNAMO_ENDPOINT)
+            return boto3.resource('dynamodb', region_name=AWS_REGION, endpoint_url=DYNAMO_ENDPOINT, config=BOTO_CONFIG)
     except Exception as e:
-        print(f"Error connecting to AWS DynamoDB: {e}", file=sys.stderr)
+        logger.error(f"Error connecting to AWS DynamoDB: {e}")
         return None
 
 def create_tables_if_not_exist():
@@ -52,7 +94,8 @@ def create_tables_if_not_exist():
         'Subjects': {'pk': 'name', 'sk': None},
         'Lectures': {'pk': 'lecture_id', 'sk': None}, # Metadata
         'LectureChunks': {'pk': 'lecture_id', 'sk': 'chunk_index'}, # Content
-        'Summaries': {'pk': 'lecture_id', 'sk': 'summary_type'} # Cache
+        'Summaries': {'pk': 'lecture_id', 'sk': 'summary_type'}, # Cache
+        'Meta': {'pk': 'name', 'sk': None} # Counters
     }
 
     existing_tables = [t.name for t in dynamodb.tables.all()]
@@ -84,13 +127,20 @@ def create_tables_if_not_exist():
                      {'AttributeName': 'lecture_id', 'AttributeType': 'S'},
                      {'AttributeName': 'chunk_index', 'AttributeType': 'N'}
                  ]
+
+            extra_args = {}
+            # Lectures: GSI on subject_name so subject pages can Query instead of Scan
+            if table_name == 'Lectures':
+                attr_defs.append({'AttributeName': 'subject_name', 'AttributeType': 'S'})
+                extra_args['GlobalSecondaryIndexes'] = [LECTURES_SUBJECT_GSI]
             
             try:
                 table = dynamodb.create_table(
                     TableName=table_name,
                     KeySchema=key_schema,
                     AttributeDefinitions=attr_defs,
-                    BillingMode='PAY_PER_REQUEST' # On-Demand (Free Tier friendly for low scale)
+                    BillingMode='PAY_PER_REQUEST', # On-Demand (Free Tier friendly for low scale)
+                    **extra_args
                 )
                 table.wait_until_exists()
                 print(f"  -> Table '{table_name}' created successfully.")
@@ -98,9 +148,31 @@ def create_tables_if_not_exist():
                 print(f"  -> Error creating {table_name}: {e}")
         else:
             print(f"Table '{table_name}' already exists.")
+            if table_name == 'Lectures':
+                ensure_lectures_subject_index(dynamodb)
 
     print("\n--- Verifying Admin User ---")
     setup_admin_user(dynamodb)
+    seed_user_id_counter(dynamodb)
+
+def ensure_lectures_subject_index(dynamodb):
+    """
+    Adds the subject_name GSI to a Lectures table created before the index existed.
+    """
+    table = dynamodb.Table('Lectures')
+    existing_indexes = [i['IndexName'] for i in (table.global_secondary_indexes or [])]
+    if LECTURES_SUBJECT_INDEX in existing_indexes:
+        return
+
+    print(f"  -> Adding index '{LECTURES_SUBJECT_INDEX}' to 'Lectures' (backfill runs in the background)...")
+    try:
+        dynamodb.meta.client.update_table(
+            TableName='Lectures',
+            AttributeDefinitions=[{'AttributeName': 'subject_name', 'AttributeType': 'S'}],
+            GlobalSecondaryIndexUpdates=[{'Create': LECTURES_SUBJECT_GSI}]
+        )
+    except ClientError as e:
+        print(f"  -> Error adding index to Lectures: {e}")
 
 def setup_admin_user(dynamodb):
     table = dynamodb.Table('Users')
@@ -109,7 +181,7 @@ def setup_admin_user(dynamodb):
         response = table.get_item(Key={'username': 'admin'})
         if 'Item' not in response:
             print("Creating default 'admin' user...")
-            hashed = bcrypt.hashpw('admin'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            hashed = bcrypt.hashpw('admin'.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
             table.put_item(Item={
                 'username': 'admin',
                 'password_hash': hashed,
@@ -119,39 +191,98 @@ def setup_admin_user(dynamodb):
     except Exception as e:
         print(f"Error checking admin user: {e}")
 
+def seed_user_id_counter(dynamodb):
+    """
+    Initializes the user_id counter from the highest existing numeric user_id (one-time Scan).
+    """
+    if 'Item' in dynamodb.Table('Meta').get_item(Key={'name': USER_ID_COUNTER}):
+        return
+
+    # Every page: a counter seeded below an existing user_id would hand that ID out again
+    users_table = dynamodb.Table('Users')
+    scan_kwargs = {'ProjectionExpression': 'user_id'}
+    users = []
+    while True:
+        response = users_table.scan(**scan_kwargs)
+        users.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    max_id = 0
+    for u in users:
+        try:
+            uid = int(u.get('user_id', 0))
+            if uid > max_id: max_id = uid
+        except ValueError:
+            pass # Ignore non-numeric IDs (like uuids or 'admin')
+
+    try:
+        # Only seed if the counter doesn't exist yet
+        dynamodb.Table('Meta').put_item(
+            Item={'name': USER_ID_COUNTER, 'seq': max_id},
+            ConditionExpression='attribute_not_exists(#n)',
+            ExpressionAttributeNames={'#n': 'name'}
+        )
+        print(f"User ID counter seeded at {max_id}.")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f"Error seeding user ID counter: {e}")
+
+def next_user_id():
+    """
+    Atomically increments the user_id counter and returns the new value as a string.
+    """
+    resp = get_table('Meta').update_item(
+        Key={'name': USER_ID_COUNTER},
+        UpdateExpression='ADD seq :one',
+        ExpressionAttributeValues={':one': 1},
+        ReturnValues='UPDATED_NEW'
+    )
+    return str(int(resp['Attributes']['seq']))
+
 # --- Helper: Deep Delete (Cascade) ---
 def delete_lecture_fully(lecture_id):
     """
     Deletes a lecture, its chunks, and its summaries.
     DynamoDB does not have Foreign Key Cascades, so we do it manually.
     """
-    dynamodb = get_dynamodb_resource()
-    from boto3.dynamodb.conditions import Key
-    
     # 1. Delete Metadata
-    dynamodb.Table('Lectures').delete_item(Key={'lecture_id': lecture_id})
+    get_table('Lectures').delete_item(Key={'lecture_id': lecture_id})
     
     # 2. Delete Chunks (Query & Batch Delete)
-    table_chunks = dynamodb.Table('LectureChunks')
-    # We only have PK=lecture_id. We can Query it.
     # To delete, we need the Sort Key (chunk_index) as well.
     try:
-        scan_chunks = table_chunks.query(KeyConditionExpression=Key('lecture_id').eq(lecture_id))
-        with table_chunks.batch_writer() as batch:
-            for item in scan_chunks.get('Items', []):
-                batch.delete_item(Key={'lecture_id': lecture_id, 'chunk_index': item['chunk_index']})
+        _delete_partition(get_table('LectureChunks'), lecture_id, 'chunk_index')
     except Exception as e:
-        print(f"Error deleting chunks for {lecture_id}: {e}")
+        logger.error(f"Error deleting chunks for {lecture_id}: {e}")
 
     # 3. Delete Summaries
-    table_summaries = dynamodb.Table('Summaries')
     try:
-        scan_sum = table_summaries.query(KeyConditionExpression=Key('lecture_id').eq(lecture_id))
-        with table_summaries.batch_writer() as batch:
-            for item in scan_sum.get('Items', []):
-                batch.delete_item(Key={'lecture_id': lecture_id, 'summary_type': item['summary_type']})
+        _delete_partition(get_table('Summaries'), lecture_id, 'summary_type')
     except Exception as e:
-        print(f"Error deleting summaries for {lecture_id}: {e}")
+        logger.error(f"Error deleting summaries for {lecture_id}: {e}")
+
+def _delete_partition(table, lecture_id, sort_key):
+    """
+    Batch-deletes every item under lecture_id, paging past the 1MB Query limit.
+    Only the sort key is projected, so item bodies (e.g. chunk text) are never downloaded.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    query_args = {
+        'KeyConditionExpression': Key('lecture_id').eq(lecture_id),
+        'ProjectionExpression': '#sk',
+        'ExpressionAttributeNames': {'#sk': sort_key}
+    }
+    with table.batch_writer() as batch:
+        while True:
+            response = table.query(**query_args)
+            for item in response.get('Items', []):
+                batch.delete_item(Key={'lecture_id': lecture_id, sort_key: item[sort_key]})
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
 if __name__ == "__main__":
     create_tables_if_not_exist()
@@ -1,13 +1,17 @@
 import os
 import sys
 import uuid
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import httpx
+import orjson
 import pymupdf  # For PDF reading (PyMuPDF)
-import requests
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import re
-import io
-import hashlib
-from PIL import Image
+import xxhash
+
+from summarization_pipeline import dedup_exact
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -19,63 +23,159 @@ HF_API_KEY = os.environ.get("HF_API_KEY")
 # Chunking settings
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100 
+CHUNK_WRITE_SHARDS = 8    # Concurrent batch writers when storing chunks
+
+# Image captioning settings
+# Switched to vit-gpt2 as BLIP-base was returning 410 (Gone) errors
+CAPTION_API_URL = "https://api-inference.huggingface.co/models/nlpconnect/vit-gpt2-image-captioning"
+CAPTION_CONCURRENCY = 10  # Max in-flight requests to the Inference API
+CAPTION_MAX_RETRIES = 2   # Retries on 503 (model loading)
+IMAGE_HASH_PREFIX = 65536 # Bytes of each image hashed for deduplication
+
+# PDF parsing settings
+PAGES_PER_WORKER = 8      # Minimum pages per process before parsing in parallel
 # --- End Configuration ---
 
+PLACEHOLDER_RE = re.compile(r"<<IMAGE_PLACEHOLDER_(\d+)>>")
+
+async def _caption_one(client, sem, headers: dict, img_bytes: bytes, idx: int) -> str:
+    """Captions one image; retries 503 (model loading) with exponential backoff."""
+    async with sem:
+        for attempt in range(CAPTION_MAX_RETRIES + 1):
+            try:
+                response = await client.post(CAPTION_API_URL, headers=headers, content=img_bytes, timeout=30)
+            except Exception as e:
+                print(f"       [Error] Failed to process image {idx+1}: {e}")
+                return "[Error processing image]"
+
+            if response.status_code == 200:
+                try:
+                    result = orjson.loads(response.content) # Decode straight from bytes
+                except orjson.JSONDecodeError as e:
+                    print(f"       [Error] Failed to process image {idx+1}: {e}")
+                    return "[Error processing image]"
+                return result.get("generated_text", "[Description unavailable]") if isinstance(result, dict) else "[Description unavailable]"
+            elif response.status_code == 503:
+                # Model loading - wait and retry
+                if attempt < CAPTION_MAX_RETRIES:
+                    await asyncio.sleep(2 * 2 ** attempt)
+                    continue
+                return "[Model loading, please retry]"
+            else:
+                print(f"       [Warning] Status {response.status_code} for image {idx+1}")
+                return "[Error processing image]"
+
+async def _caption_all(images: list, headers: dict) -> list:
+    sem = asyncio.Semaphore(CAPTION_CONCURRENCY)
+    limits = httpx.Limits(max_connections=CAPTION_CONCURRENCY, max_keepalive_connections=CAPTION_CONCURRENCY)
+    # One client for the whole batch so TCP/TLS connections are reused
+    async with httpx.AsyncClient(limits=limits) as client:
+        tasks = [_caption_one(client, sem, headers, img_bytes, idx) for idx, img_bytes in enumerate(images)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    descriptions = []
+    for idx, r in enumerate(results):
+        if not isinstance(r, str):
+            print(f"       [Error] Failed to process image {idx+1}: {r!r}")
+            r = "[Error processing image]"
+        descriptions.append(r)
+    return descriptions
+
 def get_batch_image_descriptions(images: list) -> list:
     """
     Processes images using Hugging Face Inference API (Free tier).
+    Requests run concurrently (up to CAPTION_CONCURRENCY in flight); results keep input order.
     """
     if not images:
         return []
 
-    descriptions = []
-
-    # Switched to vit-gpt2 as BLIP-base was returning 410 (Gone) errors
-    API_URL = "https://api-inference.huggingface.co/models/nlpconnect/vit-gpt2-image-captioning"
-    
     headers = {}
     if HF_API_KEY:
         headers["Authorization"] = f"Bearer {HF_API_KEY}"
 
-    BATCH_SIZE = 10
-    print(f"    -> Batch Processing {len(images)} images in groups of {BATCH_SIZE}...")
+    print(f"    -> Captioning {len(images)} images ({CAPTION_CONCURRENCY} concurrent requests)...")
+    return asyncio.run(_caption_all(images, headers))
 
-    for i in range(0, len(images), BATCH_SIZE):
-        batch = images[i:i + BATCH_SIZE]
-        batch_idx_start = i
-        print(f"       Processing batch {batch_idx_start+1}-{batch_idx_start+len(batch)}...")
-        
-        batch_descriptions = []
-        for idx, img_bytes in enumerate(batch):
-            try:
-                response = requests.post(API_URL, headers=headers, data=img_bytes, timeout=30)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    desc = result.get("generated_text", "[Description unavailable]") if isinstance(result, dict) else "[Description unavailable]"
-                    batch_descriptions.append(desc)
-                elif response.status_code == 503:
-                    # Model loading - wait and retry once
-                    import time
-                    time.sleep(2)
-                    retry_response = requests.post(API_URL, headers=headers, data=img_bytes, timeout=30)
-                    if retry_response.status_code == 200:
-                        retry_result = retry_response.json()
-                        desc = retry_result.get("generated_text", "[Description unavailable]") if isinstance(retry_result, dict) else "[Description unavailable]"
-                        batch_descriptions.append(desc)
-                    else:
-                        batch_descriptions.append("[Model loading, please retry]")
-                else:
-                    print(f"       [Warning] Status {response.status_code} for image {batch_idx_start+idx+1}")
-                    batch_descriptions.append("[Error processing image]")
-                    
-            except Exception as e:
-                print(f"       [Error] Failed to process image {batch_idx_start+idx+1}: {e}")
-                batch_descriptions.append("[Error processing image]")
-        
-        descriptions.extend(batch_descriptions)
+def _process_page_range(args) -> list:
+    """
+    Extracts pages [start, end) of a PDF. Runs in a worker process, so it opens its own document.
+    Returns segments in page order: text (str) or candidate images as (dedup_key, bytes).
+    """
+    file_path, start, end = args
+    segments = []
+    doc = pymupdf.open(file_path)
+    try:
+        for page_num in range(start, end):
+            page = doc[page_num]
+            print(f"  Processing page {page_num+1}/{len(doc)}...")
 
-    return descriptions
+            # Fast path: pages without images only need plain text (skips block/line/span objects)
+            if not page.get_images(full=False):
+                segments.append(page.get_text("text").replace("\x00", ""))
+                segments.append("\n")
+                continue
+            
+            # Get content in "dict" format for blocks
+            blocks = page.get_text("dict")["blocks"]
+            
+            for block in blocks:
+                if block["type"] == 0: # TEXT BLOCK
+                    for line in block["lines"]:
+                        segments.append("".join(span["text"].replace("\x00", "") + " " for span in line["spans"]))
+                        segments.append("\n")
+                    segments.append("\n")
+
+                elif block["type"] == 1: # IMAGE BLOCK
+                     try:
+                         image_bytes = block["image"]
+                         
+                         # 1. Strict Size Rules (> 10KB, > 250px) - cheapest check first
+                         if len(image_bytes) < 10240: # 10KB
+                             continue
+
+                         # 2. Smart Dimensions & Aspect Ratio
+                         # PyMuPDF reports the pixel size in the block itself, so no need to decode with PIL
+                         width, height = block.get("width", 0), block.get("height", 0)
+
+                         # Rule A: Must be big enough to be a diagram
+                         if width < 250 or height < 250:
+                             continue
+
+                         # Rule B: Aspect Ratio (Filter banners/footers)
+                         # If width is 4x height or height is 4x width -> likely decoration
+                         aspect_ratio = max(width, height) / min(width, height)
+                         if aspect_ratio > 3.5:
+                             continue
+
+                         # 3. Deduplication key (Critical for repeated logos/backgrounds)
+                         # Key = length + raw xxh3 digest of the first 64KB (memoryview slice: no copy)
+                         img_hash = (len(image_bytes), xxhash.xxh3_128_digest(memoryview(image_bytes)[:IMAGE_HASH_PREFIX]))
+
+                         # Passes the per-image tests; cross-page dedup happens in the parent
+                         segments.append((img_hash, image_bytes))
+                     except Exception as e:
+                         print(f"    [Warning] Failed to extract image on page {page_num+1}: {e}")
+    finally:
+        doc.close()
+    return segments
+
+def _extract_segments(file_path: str) -> list:
+    """Runs _process_page_range over the whole PDF, in parallel page ranges for long documents."""
+    with pymupdf.open(file_path) as doc:
+        n_pages = len(doc)
+
+    workers = min(os.cpu_count() or 1, max(1, n_pages // PAGES_PER_WORKER))
+    # Daemonic processes (e.g. Celery prefork workers) can't start children, so stay serial there
+    if workers <= 1 or multiprocessing.current_process().daemon:
+        return _process_page_range((file_path, 0, n_pages))
+
+    step = -(-n_pages // workers) # ceil division
+    ranges = [(file_path, s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+    print(f"  Parsing {n_pages} pages across {len(ranges)} processes...")
+    segments = []
+    with ProcessPoolExecutor(max_workers=len(ranges)) as ex:
+        for range_segments in ex.map(_process_page_range, ranges): # map keeps page order
+            segments.extend(range_segments)
+    return segments
 
 def read_document(file_path: str):
     """Reads text AND images from PDF, using PyMuPDF (fitz) + Hugging Face."""
@@ -83,10 +183,10 @@ def read_document(file_path: str):
     _, extension = os.path.splitext(file_path)
     extension = extension.lower()
     
-    all_text_content = ""
+    parts = [] # Text pieces, joined once at the end (avoids quadratic string +=)
 
     collected_images = [] # Store (bytes)
-    seen_image_hashes = set() # For deduplication
+    seen_image_hashes = set() # For deduplication: (size, prefix hash)
     image_counter = 0
 
     try:
@@ -97,85 +197,39 @@ def read_document(file_path: str):
 
         # 2. Process PDF with PyMuPDF
         print(f"  Opening with PyMuPDF...")
-        doc = pymupdf.open(file_path)
-        
-        for page_num, page in enumerate(doc):
-            print(f"  Processing page {page_num+1}/{len(doc)}...")
-            
-            # Get content in "dict" format for blocks
-            blocks = page.get_text("dict")["blocks"]
-            
-            for block in blocks:
-                if block["type"] == 0: # TEXT BLOCK
-                    block_text = ""
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            text = span["text"]
-                            text = text.replace("\x00", "")
-                            block_text += text + " "
-                        block_text += "\n"
-                    all_text_content += block_text + "\n"
+        for segment in _extract_segments(file_path):
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
 
-                elif block["type"] == 1: # IMAGE BLOCK
-                     try:
-                         image_bytes = block["image"]
-                         
-                         # 1. Deduplication (Critical for repeated logos/backgrounds)
-                         img_hash = hashlib.md5(image_bytes).hexdigest()
-                         if img_hash in seen_image_hashes:
-                             continue
-                         
-                         # 2. Strict Size Rules (> 10KB, > 250px)
-                         if len(image_bytes) < 10240: # 10KB
-                             continue
-                             
-                         # 3. Smart Dimensions & Aspect Ratio
-                         try:
-                             with Image.open(io.BytesIO(image_bytes)) as img:
-                                 width, height = img.size
-                                 
-                                 # Rule A: Must be big enough to be a diagram
-                                 if width < 250 or height < 250:
-                                     continue
-                                     
-                                 # Rule B: Aspect Ratio (Filter banners/footers)
-                                 # If width is 4x height or height is 4x width -> likely decoration
-                                 aspect_ratio = max(width, height) / min(width, height)
-                                 if aspect_ratio > 3.5:
-                                     continue
-                                     
-                         except:
-                             continue
-
-                         # If it passes all tests:
-                         seen_image_hashes.add(img_hash)
-                         collected_images.append(image_bytes)
-                         placeholder = f"<<IMAGE_PLACEHOLDER_{image_counter}>>"
-                         all_text_content += f"\n{placeholder}\n"
-                         image_counter += 1
-                     except Exception as e:
-                         print(f"    [Warning] Failed to extract image on page {page_num+1}: {e}")
+            # Serial dedup over the merged, page-ordered images
+            img_hash, image_bytes = segment
+            if img_hash in seen_image_hashes:
+                continue
+            seen_image_hashes.add(img_hash)
+            collected_images.append(image_bytes)
+            placeholder = f"<<IMAGE_PLACEHOLDER_{image_counter}>>"
+            parts.append(f"\n{placeholder}\n")
+            image_counter += 1
         
-        doc.close()
+        all_text_content = "".join(parts)
 
-        # 3. Batch Process Images (If any)
+        # 3. Batch Process Images (If any; with none there are no placeholders to resolve)
         if collected_images:
             print(f"  Found {len(collected_images)} images. Starting Batch Analysis (Hugging Face)...")
             descriptions = get_batch_image_descriptions(collected_images)
             
             # 4. Replace Placeholders
             print("  Injecting descriptions into text...")
+            replacements = {} # image index -> text to inject
             for i, desc in enumerate(descriptions):
-                placeholder = f"<<IMAGE_PLACEHOLDER_{i}>>"
-                
                 if "IRRELEVANT" in desc.upper() or "[ERROR" in desc.upper():
-                    all_text_content = all_text_content.replace(placeholder, "")
+                    replacements[i] = ""
                 else:
-                    formatted_desc = f"\n>>> [IMAGE START] >>>\n{desc}\n<<< [IMAGE END] <<<\n"
-                    all_text_content = all_text_content.replace(placeholder, formatted_desc)
-        
-        # Cleanup
-        all_text_content = re.sub(r"<<IMAGE_PLACEHOLDER_\d+>>", "", all_text_content)
+                    replacements[i] = f"\n>>> [IMAGE START] >>>\n{desc}\n<<< [IMAGE END] <<<\n"
+
+            # Single pass: inject descriptions and drop any placeholder without one
+            all_text_content = PLACEHOLDER_RE.sub(lambda m: replacements.get(int(m.group(1)), ""), all_text_content)
         
         return all_text_content
 
@@ -183,6 +237,20 @@ def read_document(file_path: str):
         print(f"Error reading file {file_path}: {e}", file=sys.stderr)
         return None
 
+def _write_chunk_shard(lecture_id: str, start: int, shard: list):
+    """Writes one contiguous shard of chunks (indices start..) through its own batch writer."""
+    from db_dynamo import get_table
+
+    # Shared process-wide Table (same pooled client as the app); each shard gets its own batch_writer buffer
+    table_chunks = get_table('LectureChunks')
+    with table_chunks.batch_writer(overwrite_by_pkeys=['lecture_id', 'chunk_index']) as batch:
+        for i, chunk in enumerate(shard, start):
+            batch.put_item(Item={
+                'lecture_id': lecture_id,
+                'chunk_index': i,
+                'chunk_text': chunk
+            })
+
 # --- Main Ingestion Function ---
 def process_and_store_lecture(file_path: str, title: str, subject_name: str):
     from db_dynamo import get_dynamodb_resource
@@ -205,7 +273,10 @@ def process_and_store_lecture(file_path: str, title: str, subject_name: str):
         separators=["\n\n", ". ", " ", ""]
     )
     chunks = text_splitter.split_text(document_text)
-    print(f"  Split into {len(chunks)} chunks.")
+    del document_text # Chunks hold the text now; don't keep both alive through the slow write phase
+    n_split = len(chunks)
+    chunks = dedup_exact(chunks)
+    print(f"  Split into {n_split} chunks ({n_split - len(chunks)} exact duplicates dropped).")
     if not chunks:
         raise ValueError("Pipeline failed: No text chunks generated.")
         
@@ -216,7 +287,6 @@ def process_and_store_lecture(file_path: str, title: str, subject_name: str):
         raise ValueError("Could not connect to AWS DynamoDB.")
         
     table_lectures = dynamodb.Table('Lectures')
-    table_chunks = dynamodb.Table('LectureChunks')
     
     try:
         # 5. Store Lecture Metadata and Chunks
@@ -237,16 +307,15 @@ def process_and_store_lecture(file_path: str, title: str, subject_name: str):
             'upload_timestamp': timestamp
         })
         
-        # B. Insert Chunks (Batch Insert)
-        print("Step 6: Inserting chunks into DynamoDB (Batch)...")
+        # B. Insert Chunks (Batch Insert, contiguous shards written concurrently)
+        step = -(-len(chunks) // CHUNK_WRITE_SHARDS) # ceil division
+        n_shards = -(-len(chunks) // step)
+        print(f"Step 6: Inserting chunks into DynamoDB (Batch, {n_shards} writers)...")
         
-        with table_chunks.batch_writer() as batch:
-            for i, chunk in enumerate(chunks):
-                batch.put_item(Item={
-                    'lecture_id': lecture_id,
-                    'chunk_index': i,
-                    'chunk_text': chunk
-                })
+        with ThreadPoolExecutor(max_workers=n_shards) as ex:
+            futures = [ex.submit(_write_chunk_shard, lecture_id, s, chunks[s:s + step]) for s in range(0, len(chunks), step)]
+            for future in futures:
+                future.result() # Re-raise any write error
 
         print("  Success! Lecture and chunks saved to DynamoDB.")
 
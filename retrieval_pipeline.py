@@ -1,4 +1,6 @@
-import sys
+import logging
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 # DB_FILE removed (Using DynamoDB)
@@ -9,40 +11,37 @@ def retrieve_chunks_for_lecture(lecture_id_to_find: str) -> list:
     Retrieves all text chunks for a specific lecture_id from DynamoDB.
     """
     from db_dynamo import get_dynamodb_resource
-    from boto3.dynamodb.conditions import Key
     
-    print(f"--- [Retrieval Module] Fetching chunks for ID: {lecture_id_to_find} ---")
+    logger.info(f"Fetching chunks for lecture {lecture_id_to_find}")
     
     try:
         dynamodb = get_dynamodb_resource()
         if not dynamodb:
-            print("Error: Could not connect to DynamoDB.", file=sys.stderr)
+            logger.error("Could not connect to DynamoDB.")
             return []
             
-        table = dynamodb.Table('LectureChunks')
-        
-        # 1. Query DynamoDB
-        # We query the partition key (lecture_id) and the sort key acts as ordering.
-        response = table.query(
-            KeyConditionExpression=Key('lecture_id').eq(lecture_id_to_find)
+        # 1. Query DynamoDB (paginated: a single Query stops at 1MB)
+        # Results come back in ascending sort-key (chunk_index) order, so no re-sort is needed.
+        paginator = dynamodb.meta.client.get_paginator('query')
+        pages = paginator.paginate(
+            TableName='LectureChunks',
+            KeyConditionExpression='lecture_id = :lid',
+            ExpressionAttributeValues={':lid': lecture_id_to_find},
+            ProjectionExpression='chunk_text',
+            ScanIndexForward=True
         )
         
-        items = response.get('Items', [])
-        
-        # 2. Sort by chunk_index (DynamoDB usually returns sorted if queried by SK, but good to be safe)
-        items.sort(key=lambda x: int(x['chunk_index']))
-        
-        # 3. Extract text
-        all_text_chunks = [item['chunk_text'] for item in items]
+        # 2. Extract text (the resource's client already (de)serializes attribute values)
+        all_text_chunks = [item['chunk_text'] for page in pages for item in page['Items']]
 
     except Exception as e:
-        print(f"Error: Failed to query DynamoDB. {e}", file=sys.stderr)
+        logger.error(f"Failed to query DynamoDB: {e}")
         return []
 
     if not all_text_chunks:
-        print(f"Warning: No chunks found for ID '{lecture_id_to_find}'.")
+        logger.warning(f"No chunks found for ID '{lecture_id_to_find}'.")
     else:
-        print(f"Success: Found {len(all_text_chunks)} text chunks.")
+        logger.info(f"Found {len(all_text_chunks)} text chunks.")
     
     return all_text_chunks
 
@@ -1,11 +1,18 @@
 import os
-import sys
+import logging
 import re
+import threading
+import httpx
+import numpy as np
+import xxhash
+from collections import OrderedDict
 from openai import OpenAI
 
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 # 1. LOAD API KEY FROM ENVIRONMENT
 # WARNING: This is insecure. Do not share this file.
@@ -17,22 +24,30 @@ API_KEY = os.environ.get("OPENROUTER_API_KEY")
 MODEL_NAME = "google/gemini-2.5-flash-lite"
 
 # --- 3. CONFIGURE THE OPENROUTER CLIENT ---
+# One client per process: its httpx pool keeps TLS connections to OpenRouter alive between summaries
+_CLIENT = None
+
 def get_openai_client():
-    """Creates a fresh OpenAI client for each request to avoid session staleness."""
-    if API_KEY and API_KEY.startswith("sk-or-"):
-        return OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=API_KEY,
-        )
-    elif os.environ.get("OPENROUTER_API_KEY"):
-        return OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.environ.get("OPENROUTER_API_KEY"),
-        )
-    else:
-        print("FATAL ERROR: OPENROUTER_API_KEY is not set or invalid in summarization_pipeline.py.", file=sys.stderr)
+    """Returns the shared OpenRouter client, creating it on first use."""
+    global _CLIENT
+    if _CLIENT is not None:
+        return _CLIENT
+
+    api_key = API_KEY if API_KEY and API_KEY.startswith("sk-or-") else os.environ.get("OPENROUTER_API_KEY")
+    if not api_key:
+        logger.error("OPENROUTER_API_KEY is not set or invalid in summarization_pipeline.py.")
         return None
 
+    _CLIENT = OpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=api_key,
+        http_client=httpx.Client(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=httpx.Timeout(300.0, connect=10.0) # Long summaries can take minutes to generate
+        ),
+    )
+    return _CLIENT
+
 # -----------------------------------------------------------------
 # --- SIMPLIFIED PROMPT TEMPLATES (SYSTEM INSTRUCTIONS ONLY) ---
 # -----------------------------------------------------------------
@@ -88,37 +103,45 @@ You are an expert editor compiling a **COMPREHENSIVE SUMMARY**.
 # --- HELPER FUNCTIONS ---
 # -----------------------------------------------------------------
 
+# Precompiled patterns (these helpers run several times per summary)
+# Match alphanumeric words (English + Arabic + Numbers), ignoring symbols like *, #, -
+WORD_RE = re.compile(r'\b[\w\u0600-\u06FF]+\b')
+LATEX_INLINE_RE = re.compile(r'\$[^$]+\$')
+LATEX_BLOCK_RE = re.compile(r'\$\$[^$]+\$\$')
+CODE_FENCE_RE = re.compile(r'```[\s\S]*?```')
+INLINE_CODE_RE = re.compile(r'`[^`\n]+`')
+# Arabic code point blocks (Arabic, Supplement, Extended-A, Presentation Forms A/B)
+ARABIC_RANGES = [(0x0600, 0x06FF), (0x0750, 0x077F), (0x08A0, 0x08FF), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF)]
+# Junk tokens stripped from LLM output, one full pass each in this order (a single regex alternation differs on backtick runs)
+JUNK_TOKENS = ("<|im_start|>", "<|im_end|>", "system", "/doc", "```json", "```")
+
 def count_words(text: str) -> int:
     """Counts legitimate words (alphanumeric + Arabic), ignoring markdown syntax."""
     # Remove LaTeX math delimiters
-    text = re.sub(r'\$[^$]+\$', '', text)
-    text = re.sub(r'\$\$[^$]+\$\$', '', text)
-    # Match alphanumeric words (English + Arabic + Numbers), ignoring symbols like *, #, -
+    text = LATEX_INLINE_RE.sub('', text)
+    text = LATEX_BLOCK_RE.sub('', text)
     # \w matches [a-zA-Z0-9_] and unicode characters depending on flags, but explicit ranges are safer.
     # We use a broad range to caption Latin and Arabic words.
-    words = re.findall(r'\b[\w\u0600-\u06FF]+\b', text)
-    return len(words)
+    return sum(1 for _ in WORD_RE.finditer(text))
 
 def clean_output(text: str) -> str:
     """Cleans junk tokens from the LLM output."""
-    junk_tokens = ["<|im_start|>", "<|im_end|>", "system", "/doc", "```json", "```"]
-    for token in junk_tokens:
+    for token in JUNK_TOKENS:
         text = text.replace(token, "")
     return text.strip()
 
 def smart_truncate(text: str, max_words: int) -> str:
     """Truncates text to max_words, stopping at the last complete sentence, preserving formatting."""
-    # 1. Check count first to avoid work if not needed
-    matches = list(re.finditer(r'\b[\w\u0600-\u06FF]+\b', text))
-    count = len(matches)
-    
-    if count <= max_words:
-        return text
-    
-    # 2. Find the strict cut-off point (end of the max_words-th word)
-    # Index is max_words - 1 because list is 0-indexed
-    strict_limit_match = matches[max_words - 1] 
-    strict_limit_index = strict_limit_match.end()
+    # 1-2. Stream words and stop at the strict cut-off point (end of the max_words-th word)
+    # Index is max_words - 1 because enumerate is 0-indexed
+    strict_limit_index = None
+    for i, match in enumerate(WORD_RE.finditer(text)):
+        if i == max_words - 1:
+            strict_limit_index = match.end()
+        elif i == max_words:
+            break # At least one word past the limit, so truncation is needed
+    else:
+        return text # Within the limit
     
     # 3. Work backwards from there to find the last sentence end (. ! ?)
     # We slice strictly within the limit
@@ -135,15 +158,27 @@ def smart_truncate(text: str, max_words: int) -> str:
     # Fallback: If no period found (extremely rare long sentence run), just hard cut and add period.
     return candidate_text + "."
 
+def count_arabic_latin(text: str) -> tuple:
+    """Counts Arabic and Latin letters with vectorized NumPy comparisons over the code points."""
+    # surrogatepass: PDF text can carry lone surrogates; they fall outside both ranges anyway
+    cp = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    arabic_mask = np.zeros(cp.shape, dtype=bool)
+    for lo, hi in ARABIC_RANGES:
+        arabic_mask |= (cp >= lo) & (cp <= hi)
+    latin_mask = ((cp >= 0x41) & (cp <= 0x5A)) | ((cp >= 0x61) & (cp <= 0x7A))
+    return int(np.count_nonzero(arabic_mask)), int(np.count_nonzero(latin_mask))
+
 def detect_primary_language(text: str) -> str:
     """Detect the primary language of the text."""
     # 1. Remove Code Blocks (```...```) and Inline Code (`...`) to avoid skewing detection
     # Code is usually English, which can hide the fact that the *commentary* is Arabic.
-    text_no_code = re.sub(r'```[\s\S]*?```', '', text)
-    text_no_code = re.sub(r'`[^`\n]+`', '', text_no_code)
+    # Most lectures contain no backticks at all, so skip both passes in that case
+    text_no_code = text
+    if '`' in text:
+        text_no_code = CODE_FENCE_RE.sub('', text_no_code)
+        text_no_code = INLINE_CODE_RE.sub('', text_no_code)
 
-    arabic_chars = len(re.findall(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]', text_no_code))
-    latin_chars = len(re.findall(r'[a-zA-Z]', text_no_code))
+    arabic_chars, latin_chars = count_arabic_latin(text_no_code)
     
     # Strict Majority Rule (No 0.5 threshold).
     # If Arabic characters outnumber Latin characters in the non-code text, it's Arabic.
@@ -152,6 +187,40 @@ def detect_primary_language(text: str) -> str:
     else:
         return "English"
 
+# Same lecture summarized at several tiers -> same text; keyed by content hash, not the text itself
+_LANG_CACHE = OrderedDict()
+_LANG_CACHE_LOCK = threading.Lock() # Summaries run on concurrent request threads
+LANG_CACHE_SIZE = 32
+
+def detect_language_cached(text: str) -> str:
+    """detect_primary_language, memoized on an xxh3 hash of the text (LRU, LANG_CACHE_SIZE entries)."""
+    key = (xxhash.xxh3_64_intdigest(text.encode("utf-8", errors="surrogatepass")), len(text))
+    with _LANG_CACHE_LOCK:
+        lang = _LANG_CACHE.get(key)
+        if lang is not None:
+            _LANG_CACHE.move_to_end(key)
+            return lang
+    # Detect outside the lock; a concurrent miss on the same text just computes it twice
+    lang = detect_primary_language(text)
+    with _LANG_CACHE_LOCK:
+        _LANG_CACHE[key] = lang
+        _LANG_CACHE.move_to_end(key)
+        if len(_LANG_CACHE) > LANG_CACHE_SIZE:
+            _LANG_CACHE.popitem(last=False)
+    return lang
+
+def dedup_exact(chunks: list) -> list:
+    """Drops exact duplicate chunks (e.g. repeated title/footer slides), keeping first occurrences in order."""
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        h = xxhash.xxh3_64_intdigest(chunk.encode("utf-8", errors="surrogatepass")) # PDF text can hold lone surrogates
+        if h in seen:
+            continue
+        seen.add(h)
+        unique.append(chunk)
+    return unique
+
 # -----------------------------------------------------------------
 # --- MAIN PIPELINE (SINGLE SHOT) ---
 # -----------------------------------------------------------------
@@ -160,7 +229,6 @@ def run_single_shot_summary(chunks: list, target_words: int = 600) -> str:
     """
     Simpler, smarter pipeline. Sends all chunks to Gemini in one go.
     """
-    # Create a fresh client for this request
     client = get_openai_client()
 
     if not client:
@@ -169,14 +237,16 @@ def run_single_shot_summary(chunks: list, target_words: int = 600) -> str:
     if not chunks:
         return "Error: No content found."
 
-    print(f"--- [Gemini Single-Shot] Summarizing {len(chunks)} chunks... ---")
+    # Defensive: lectures stored before ingestion-time dedup may still repeat chunks
+    chunks = dedup_exact(chunks)
+    logger.info(f"Summarizing {len(chunks)} chunks (single shot)")
     
     # 1. Combine all text
     combined_notes = "\n\n".join(chunks)
     
     # 2. Detect Language
-    detected_lang = detect_primary_language(combined_notes)
-    print(f"    Detected language: {detected_lang}")
+    detected_lang = detect_language_cached(combined_notes)
+    logger.info(f"Detected language: {detected_lang}")
     
     # 3. Create Strict Language Instruction
     if detected_lang == "Arabic":
@@ -199,7 +269,7 @@ def run_single_shot_summary(chunks: list, target_words: int = 600) -> str:
 
     if target_words <= 300:
         template = SYSTEM_INSTRUCTION_TIER_1
-        print("    -> Using TIER 1 System Rules (Cheat Sheet)")
+        logger.info("Using TIER 1 System Rules (Cheat Sheet)")
         
         # [Aggressive Buffer for Concise]
         # Models struggle with small limits (they like to talk).
@@ -209,21 +279,21 @@ def run_single_shot_summary(chunks: list, target_words: int = 600) -> str:
         # Models ignore small limits. We cut the target to 35% to force brevity.
         # Target 300 -> Ask for 105.
         effective_target_words = int(target_words * 0.35)
-        print(f"    -> [Hyper-Aggressive Buffer] Tier 1 Target reduced to {effective_target_words} (Limit: {target_words})")
+        logger.info(f"[Hyper-Aggressive Buffer] Tier 1 Target reduced to {effective_target_words} (Limit: {target_words})")
 
     elif target_words <= 600:
         template = SYSTEM_INSTRUCTION_TIER_2
-        print("    -> Using TIER 2 System Rules (Standard)")
+        logger.info("Using TIER 2 System Rules (Standard)")
         
         # [Standard Buffer] Target 60% of the limit to provide a safe margin.
         # Aiming for ~360 words on a 600-word limit.
         effective_target_words = int(target_words * 0.60)
             
-        print(f"    -> [Standard Buffer] Tier 2 Target: {effective_target_words} (Limit: {target_words})")
+        logger.info(f"[Standard Buffer] Tier 2 Target: {effective_target_words} (Limit: {target_words})")
         
     else:
         template = SYSTEM_INSTRUCTION_TIER_3
-        print("    -> Using TIER 3 System Rules (Comprehensive)")
+        logger.info("Using TIER 3 System Rules (Comprehensive)")
     
     # 5. Format the SYSTEM message with rules
     system_rules = template.format(
@@ -234,7 +304,7 @@ def run_single_shot_summary(chunks: list, target_words: int = 600) -> str:
     # 6. Prepare the User Content (Just the data)
     user_content = f"Here is the lecture content to summarize:\n\n{combined_notes}"
 
-    print(f"\n--- [DEBUG] SYSTEM RULES ---\n{system_rules}\n--- [DEBUG] END RULES ---\n")
+    logger.debug(f"System rules:\n{system_rules}")
 
     try:
         # Calculate a dynamic hard token limit to prevent run-on generations.
@@ -244,7 +314,7 @@ def run_single_shot_summary(chunks: list, target_words: int = 600) -> str:
         
         # Set a sensible floor (e.g., 250 tokens) to allow for structure.
         hard_token_limit = max(hard_token_limit, 250)
-        print(f"    -> [Safety Net] Hard token limit set to {hard_token_limit}")
+        logger.info(f"[Safety Net] Hard token limit set to {hard_token_limit}")
 
         response = client.chat.completions.create(
             model=MODEL_NAME,
@@ -261,10 +331,10 @@ def run_single_shot_summary(chunks: list, target_words: int = 600) -> str:
         # If the model ignored the instructions and went over, we cut it off intelligently.
         final_text = smart_truncate(result, target_words)
         
-        print(f"--- [Gemini Single-Shot] Completed. Length: {count_words(final_text)} words. (Limit: {target_words}) ---")
+        logger.info(f"Summary completed. Length: {count_words(final_text)} words. (Limit: {target_words})")
         return final_text
 
     except Exception as e:
-        print(f"Error in Gemini Summary: {e}", file=sys.stderr)
+        logger.error(f"Error in Gemini Summary: {e}")
         return f"Error generating summary: {e}"
 
@@ -0,0 +1,35 @@
+import os
+from celery import Celery
+from celery.result import AsyncResult
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from ingestion_pipeline import process_and_store_lecture
+
+# --- Configuration ---
+# Redis is both the broker and the result backend (same REDIS_URL as the web app)
+REDIS_URL = os.environ.get("REDIS_URL")
+
+celery_app = Celery('majima', broker=REDIS_URL, backend=REDIS_URL)
+# --- End Configuration ---
+
+@celery_app.task(name='ingest_lecture')
+def ingest_lecture_task(file_path: str, title: str, subject_name: str):
+    """
+    Runs the ingestion pipeline on a worker so the upload request returns immediately.
+    The worker must share the web app's upload folder (same host or shared volume).
+    """
+    try:
+        process_and_store_lecture(file_path, title, subject_name)
+    except Exception:
+        if os.path.exists(file_path): os.remove(file_path)
+        raise
+
+def get_job_state(job_id: str) -> dict:
+    """Returns the Celery state (and error message, if it failed) for an ingestion job."""
+    result = AsyncResult(job_id, app=celery_app)
+    state = {'job_id': job_id, 'state': result.state}
+    if result.failed():
+        state['error'] = str(result.result)
+    return state